@@ -1,15 +1,32 @@
+from contextlib import contextmanager
 from dataclasses import dataclass
+from functools import lru_cache
 import os
+import stat
+import tempfile
 import inquirer
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, BarColumn, TextColumn, TimeElapsedColumn
-from typing import Optional
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-import requests
+from typing import BinaryIO, Callable, Iterator, Optional
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from argon2.low_level import Type, hash_secret_raw
+import httpx
 import hashlib
 
 console = Console()
 
+# Client HTTP/2 partagé : la connexion TLS vers HaveIBeenPwned est réutilisée
+_HIBP = httpx.Client(http2=True, timeout=5.0, headers={"Add-Padding": "true"})
+
+
+@lru_cache(maxsize=256)
+def _pwned_prefix(prefix: str) -> frozenset:
+    # Cache indexé sur le préfixe SHA-1 uniquement : le mot de passe n'est jamais mémorisé
+    response = _HIBP.get(f"https://api.pwnedpasswords.com/range/{prefix}")
+    response.raise_for_status()  # une erreur n'est pas mise en cache
+    # Chaque ligne est "SUFFIXE:COMPTE", le suffixe faisant toujours 35 caractères
+    return frozenset(line[:35] for line in response.text.splitlines())
+
 
 @dataclass
 class EncryptConfig:
@@ -19,10 +36,28 @@ class EncryptConfig:
     output_path: Optional[str] = None
 
 
+@dataclass
+class EncryptedHeader:
+    salt: Optional[bytes]  # None pour les fichiers YJCHGCM1
+    iv: bytes
+    tag: bytes
+    data_offset: int
+    data_len: int
+
+
 class FileEncryptor:
-    HEADER_SIGNATURE = b"YJCHGCM1"
+    HEADER_SIGNATURE = b"YJCHGCM2"
+    LEGACY_HEADER_SIGNATURE = b"YJCHGCM1"  # clé SHA-256 sans sel
     HEADER_LEN = len(HEADER_SIGNATURE)
+    SALT_LEN = 16
     IV_LEN = 12  # nonce size for AES-GCM
+    TAG_LEN = 16  # tag d'authentification AES-GCM
+    CHUNK_SIZE = 1 << 20  # 1 MiB, multiple de la taille de bloc AES
+
+    # Argon2id, profil "faible mémoire" recommandé par la RFC 9106
+    ARGON2_TIME_COST = 3
+    ARGON2_MEMORY_COST = 64 * 1024  # en KiB
+    ARGON2_PARALLELISM = 4
 
     def __init__(self, config: EncryptConfig):
         self.config = config
@@ -53,9 +88,13 @@ class FileEncryptor:
 
     def _is_already_encrypted(self, path: str) -> bool:
         try:
-            with open(path, "rb") as f:
-                header = f.read(self.HEADER_LEN)
-                return header == self.HEADER_SIGNATURE
+            # Lecture brute : inutile d'allouer un BufferedReader pour 8 octets
+            fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            try:
+                header = os.read(fd, self.HEADER_LEN)
+            finally:
+                os.close(fd)
+            return header in (self.HEADER_SIGNATURE, self.LEGACY_HEADER_SIGNATURE)
         except FileNotFoundError:
             console.print(f"[red]Fichier introuvable : {path}[/red]")
             return False
@@ -78,34 +117,22 @@ class FileEncryptor:
                 console.print("[yellow]Opération annulée par l'utilisateur.[/yellow]")
                 return
 
-        key = self._derive_key(password)
+        salt = os.urandom(self.SALT_LEN)
+        key = self._derive_key(password, salt)
         iv = os.urandom(self.IV_LEN)
-        aesgcm = AESGCM(key)
+        encryptor = Cipher(algorithms.AES(key), modes.GCM(iv)).encryptor()
 
         file_size = os.path.getsize(path)
-        chunk_size = 64 * 1024
 
-        with open(path, "rb") as fin:
-            data = fin.read()
-
-        # Chiffrement complet en mémoire (AES-GCM nécessite tout d'un coup)
-        with Progress(
-            SpinnerColumn(),
-            "[progress.description]{task.description}",
-            BarColumn(),
-            "[progress.percentage]{task.percentage:>3.1f}%",
-            TimeElapsedColumn(),
-            console=console,
-        ) as progress:
-            task = progress.add_task("[green]Chiffrement en cours...", total=file_size)
-            # Simuler progression (car tout en mémoire)
-            encrypted = aesgcm.encrypt(iv, data, None)
-            progress.update(task, advance=file_size)
-
-        with open(output_path, "wb") as fout:
-            fout.write(self.HEADER_SIGNATURE)
-            fout.write(iv)
-            fout.write(encrypted)  # ciphertext + tag à la fin automatiquement
+        # Chiffrement par blocs : mémoire constante quelle que soit la taille du fichier
+        with open(path, "rb") as fin, self._atomic_output(output_path) as fout, \
+                self._track("[green]Chiffrement en cours...", file_size) as advance:
+            fout.write(self.HEADER_SIGNATURE + salt + iv)  # en-tête en une seule écriture
+            while chunk := fin.read(self.CHUNK_SIZE):
+                fout.write(encryptor.update(chunk))
+                advance(len(chunk))
+            fout.write(encryptor.finalize())
+            fout.write(encryptor.tag)  # tag à la fin du fichier
 
         console.print(f"[bold green]Fichier chiffré créé :[/bold green] {output_path}")
 
@@ -123,39 +150,30 @@ class FileEncryptor:
             console.print("[yellow]Ce fichier ne semble pas être chiffré par ce programme.[/yellow]")
             return
 
-        output_default = path.rsplit(".yjch", 1)[0]
+        output_default = path.removesuffix(".yjch")
+        if output_default == path:
+            # Ne jamais proposer d'écraser le fichier chiffré lui-même
+            output_default = f"{path}.dec"
         output_path = self._ask_output_path(output_default)
+        if os.path.exists(output_path) and os.path.samefile(path, output_path):
+            console.print("[red]Le fichier de sortie ne peut pas être le fichier chiffré lui-même.[/red]")
+            return
+
+        # En-tête lu une seule fois : seule la clé change d'un essai à l'autre
+        header = self._read_header(path)
+        if header is None:
+            console.print("[red]Fichier chiffré tronqué ou corrompu.[/red]")
+            return
 
         while True:
             password = self._ask_password()
             if not password:
                 console.print("[red]Mot de passe vide, réessayez.[/red]")
                 continue
-            key = self._derive_key(password)
+            key = self._derive_key(password, header.salt)
 
             try:
-                with open(path, "rb") as fin:
-                    fin.seek(self.HEADER_LEN)
-                    iv = fin.read(self.IV_LEN)
-                    encrypted_data = fin.read()
-
-                aesgcm = AESGCM(key)
-
-                with Progress(
-                    SpinnerColumn(),
-                    "[progress.description]{task.description}",
-                    BarColumn(),
-                    "[progress.percentage]{task.percentage:>3.1f}%",
-                    TimeElapsedColumn(),
-                    console=console,
-                ) as progress:
-                    task = progress.add_task("[cyan]Déchiffrement en cours...", total=len(encrypted_data))
-                    # Déchiffrement complet en mémoire
-                    decrypted = aesgcm.decrypt(iv, encrypted_data, None)
-                    progress.update(task, advance=len(encrypted_data))
-
-                with open(output_path, "wb") as fout:
-                    fout.write(decrypted)
+                self._decrypt_stream(path, output_path, key, header)
                 break  # succès => sortir boucle
 
             except Exception:
@@ -170,6 +188,86 @@ class FileEncryptor:
             os.remove(path)
             console.print("[bold red]Fichier chiffré supprimé.[/bold red]")
 
+    def _read_header(self, path: str) -> Optional[EncryptedHeader]:
+        file_size = os.path.getsize(path)
+        with open(path, "rb") as fin:
+            signature = fin.read(self.HEADER_LEN)
+            salt = fin.read(self.SALT_LEN) if signature == self.HEADER_SIGNATURE else None
+            data_offset = fin.tell() + self.IV_LEN
+            data_len = file_size - data_offset - self.TAG_LEN
+            if data_len < 0:
+                return None
+            iv = fin.read(self.IV_LEN)
+            fin.seek(file_size - self.TAG_LEN)
+            tag = fin.read(self.TAG_LEN)
+        return EncryptedHeader(salt=salt, iv=iv, tag=tag, data_offset=data_offset, data_len=data_len)
+
+    def _decrypt_stream(self, path: str, output_path: str, key: bytes, header: EncryptedHeader) -> None:
+        decryptor = Cipher(algorithms.AES(key), modes.GCM(header.iv, header.tag)).decryptor()
+
+        with open(path, "rb") as fin:
+            fin.seek(header.data_offset)
+            # Le clair n'atteint output_path qu'une fois le tag vérifié
+            with self._atomic_output(output_path) as fout, \
+                    self._track("[cyan]Déchiffrement en cours...", header.data_len) as advance:
+                remaining = header.data_len
+                while remaining > 0:
+                    chunk = fin.read(min(self.CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise ValueError("Fichier chiffré tronqué")
+                    remaining -= len(chunk)
+                    fout.write(decryptor.update(chunk))
+                    advance(len(chunk))
+                # Vérifie le tag : lève InvalidTag si mot de passe incorrect
+                fout.write(decryptor.finalize())
+
+    @contextmanager
+    def _atomic_output(self, output_path: str) -> Iterator[BinaryIO]:
+        # Écrit dans un fichier temporaire du même dossier, renommé seulement en cas de succès
+        tmp = tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(os.path.abspath(output_path)),
+            prefix=f".{os.path.basename(output_path)}.",
+            suffix=".tmp",
+            delete=False,
+        )
+        try:
+            with tmp:
+                yield tmp
+            os.chmod(tmp.name, self._output_mode(output_path))
+            os.replace(tmp.name, output_path)
+        except BaseException:
+            if os.path.exists(tmp.name):
+                os.remove(tmp.name)
+            raise
+
+    def _output_mode(self, output_path: str) -> int:
+        # NamedTemporaryFile crée en 0600 : on reprend le mode qu'aurait donné open(..., "wb")
+        try:
+            return stat.S_IMODE(os.stat(output_path).st_mode)
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            return 0o666 & ~umask
+
+    @contextmanager
+    def _track(self, description: str, total: int) -> Iterator[Callable[[int], None]]:
+        # Un seul bloc à traiter : une barre de progression n'apporte rien
+        if total <= self.CHUNK_SIZE:
+            console.print(description)
+            yield lambda advance: None
+            return
+
+        with Progress(
+            SpinnerColumn(),
+            "[progress.description]{task.description}",
+            BarColumn(),
+            "[progress.percentage]{task.percentage:>3.1f}%",
+            TimeElapsedColumn(),
+            console=console,
+        ) as progress:
+            task = progress.add_task(description, total=total)
+            yield lambda advance: progress.update(task, advance=advance)
+
     def _ask_file_path(self) -> Optional[str]:
         question = [inquirer.Text("file_path", message="Chemin du fichier")]
         answer = inquirer.prompt(question)
@@ -203,21 +301,30 @@ class FileEncryptor:
         answer = inquirer.prompt(question)
         return answer.get("confirm", False)
 
-    def _derive_key(self, password: str) -> bytes:
-        return hashlib.sha256(password.encode("utf-8")).digest()
+    def _derive_key(self, password: str, salt: Optional[bytes]) -> bytes:
+        if salt is None:
+            # Fichiers YJCHGCM1 : ancienne dérivation conservée pour rester déchiffrables.
+            # Pas de variante BLAKE2 : le format est figé et Argon2id couvre les nouveaux fichiers.
+            return hashlib.sha256(password.encode("utf-8")).digest()
+        return hash_secret_raw(
+            password.encode("utf-8"),
+            salt,
+            time_cost=self.ARGON2_TIME_COST,
+            memory_cost=self.ARGON2_MEMORY_COST,
+            parallelism=self.ARGON2_PARALLELISM,
+            hash_len=32,
+            type=Type.ID,
+        )
 
     def _check_password_pwned(self, password: str) -> bool:
         sha1_pw = hashlib.sha1(password.encode("utf-8")).hexdigest().upper()
         prefix, suffix = sha1_pw[:5], sha1_pw[5:]
 
-        url = f"https://api.pwnedpasswords.com/range/{prefix}"
         try:
-            response = requests.get(url)
-            if response.status_code != 200:
-                console.print("[red]Erreur API HaveIBeenPwned[/red]")
-                return False
-            hashes = (line.split(":")[0] for line in response.text.splitlines())
-            return suffix in hashes
+            return suffix in _pwned_prefix(prefix)
+        except httpx.HTTPStatusError:
+            console.print("[red]Erreur API HaveIBeenPwned[/red]")
+            return False
         except Exception:
             console.print("[red]Erreur de connexion à l'API HaveIBeenPwned[/red]")
             return False
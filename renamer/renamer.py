@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Optional, FrozenSet
 from dataclasses import dataclass
 import os
 import re
@@ -8,6 +8,8 @@ from colorama import Fore, Style, init
 
 init(autoreset=True)
 
+TMP_SUFFIX = ".__rn_tmp"
+
 
 @dataclass
 class RenameConfig:
@@ -19,12 +21,16 @@ class RenameConfig:
     pattern: Optional[str] = None
     dry_run: bool = True
     replace: Optional[str] = None  # format attendu : 'ancien:nouveau'
-    exclude: Optional[List[str]] = None
+    exclude: FrozenSet[str] = frozenset()  # toute séquence est acceptée, convertie en frozenset
     confirm: bool = False
     sort_mode: str = "alpha"  # 'alpha' ou 'date'
     index_format: str = "{:02}"  # ex: '{:03}' pour index à 3 chiffres
     start_index: int = 0
 
+    def __post_init__(self):
+        # Exclusions converties une seule fois : recherche en O(1) par fichier
+        self.exclude = frozenset(self.exclude or ())
+
 
 class FileRenamer:
     """Classe principale pour renommer des fichiers avec différentes fonctionnalités."""
@@ -35,11 +41,13 @@ class FileRenamer:
         self.dry_run = config.dry_run
         self.pattern = config.pattern
         self.replace = self._parse_replace(config.replace)
-        self.exclude = config.exclude or []
+        self.exclude = config.exclude
         self.confirm = config.confirm
         self.sort_mode = config.sort_mode
         self.index_format = config.index_format
         self.files = []
+        self._today = datetime.now().strftime("%Y%m%d")
+        self._base = os.path.join(self.path, "")  # dossier avec séparateur final
 
     def _parse_replace(self, replace_str):
         """Transforme 'ancien:nouveau' en tuple ('ancien', 'nouveau')."""
@@ -49,16 +57,16 @@ class FileRenamer:
 
     def _list_files(self):
         """Liste les fichiers du dossier, triés selon la méthode choisie."""
-        files = [f for f in os.listdir(self.path)
-                 if os.path.isfile(os.path.join(self.path, f))
-                 and f not in self.exclude]
+        # scandir réutilise les infos du parcours : pas de stat() par fichier
+        with os.scandir(self.path) as it:
+            entries = [e for e in it
+                       if e.is_file() and e.name not in self.exclude]
 
         if self.sort_mode == "date":
-            files.sort(key=lambda f: os.path.getmtime(
-                os.path.join(self.path, f)))
+            entries.sort(key=lambda e: e.stat().st_mtime)
         else:
-            files.sort()
-        self.files = files
+            entries.sort(key=lambda e: e.name)
+        self.files = [e.name for e in entries]
 
     def _format_name(self, filename, index):
         """Génère le nouveau nom du fichier selon le pattern."""
@@ -66,7 +74,7 @@ class FileRenamer:
         new_name = self.pattern or "{name}_{index}"
         new_name = new_name.format(
             name=name,
-            date=datetime.now().strftime("%Y%m%d"),
+            date=self._today,
             index=self.index_format.format(index)
         )
         return new_name + ext
@@ -85,25 +93,117 @@ class FileRenamer:
             if choice in ('y', 'n'):
                 return choice == 'y'
 
+    def _find_conflicts(self, plan):
+        """Détecte les renommages qui écraseraient un fichier."""
+        sources = {original_path for original_path, *_ in plan}
+        tmp_paths = {tmp_path for _, tmp_path, *_ in plan}
+        # Clé insensible à la casse : sur macOS/Windows, "Photo" désigne le fichier "photo"
+        sources_by_key = {original_path.casefold(): original_path
+                          for original_path in sources}
+        targets = set()
+        conflicts = []
+        for original_path, tmp_path, new_path, filename, new_name in plan:
+            if new_path in targets:
+                conflicts.append(f"{filename} → {new_name} : cible déjà attribuée à un autre fichier")
+            elif new_path in tmp_paths and new_path != tmp_path:
+                # La passe 2 écraserait le fichier temporaire d'un autre fichier
+                conflicts.append(f"{filename} → {new_name} : la cible est un nom temporaire du renommage")
+            elif new_path not in sources and os.path.lexists(new_path) \
+                    and not self._is_source(new_path, sources_by_key):
+                conflicts.append(f"{filename} → {new_name} : la cible existe et ne fait pas partie du renommage")
+            if os.path.lexists(tmp_path):
+                conflicts.append(f"Fichier temporaire déjà présent : {filename}{TMP_SUFFIX}")
+            targets.add(new_path)
+        return conflicts
+
+    def _is_source(self, path, sources_by_key):
+        """Vrai si path est, à la casse près, un fichier du renommage."""
+        source = sources_by_key.get(path.casefold())
+        return source is not None and os.path.samefile(path, source)
+
+    def _run_pass(self, moves):
+        """Applique une passe de renommages, retourne ceux réussis et l'erreur éventuelle."""
+        # Séquentiel : les renommages d'un même dossier sont sérialisés par le noyau,
+        # et s'arrêter au premier échec garde l'annulation déterministe
+        done = []
+        for src, dst in moves:
+            try:
+                os.replace(src, dst)
+            except OSError as e:
+                return done, e
+            done.append((src, dst))
+        return done, None
+
+    def _undo(self, moves):
+        """Annule des renommages, retourne les chemins restés bloqués."""
+        stranded = []
+        for src, dst in reversed(moves):
+            try:
+                os.replace(dst, src)
+            except OSError:
+                stranded.append(dst)
+        return stranded
+
+    def _apply_plan(self, plan):
+        """Renomme en deux passes ; en cas d'échec, restaure les noms d'origine."""
+        to_tmp = [(original_path, tmp_path)
+                  for original_path, tmp_path, *_ in plan]
+        to_new = [(tmp_path, new_path)
+                  for _, tmp_path, new_path, *_ in plan]
+
+        # Deux passes : un nom cible peut être le nom source d'un autre fichier
+        moved_tmp, error = self._run_pass(to_tmp)
+        if error is None:
+            moved_new, error = self._run_pass(to_new)
+            if error is None:
+                return True
+            stranded = self._undo(moved_new)
+        else:
+            stranded = []
+        stranded += self._undo(moved_tmp)
+
+        print(Fore.RED + f"Erreur lors du renommage : {error}")
+        if stranded:
+            print(Fore.RED + "Restauration impossible pour : " + ", ".join(stranded))
+        else:
+            print(Fore.RED + "Aucun fichier renommé, noms d'origine restaurés.")
+        return False
+
     def rename(self):
         """Exécute le processus de renommage des fichiers."""
         self._list_files()
+        plan = []
         for idx, filename in enumerate(self.files, 1):
-            original_path = os.path.join(self.path, filename)
+            original_path = self._base + filename
             new_name = self._format_name(filename, idx)
             new_name = self._apply_replace(new_name)
-            new_path = os.path.join(self.path, new_name)
+            new_path = self._base + new_name
 
             if original_path == new_path:
                 continue
 
-            if self.dry_run:
+            if not self.dry_run and self.confirm \
+                    and not self._confirm(filename, new_name):
+                print(Fore.RED + f"Renommage annulé pour : {filename}")
+                continue
+            plan.append((original_path, original_path + TMP_SUFFIX,
+                         new_path, filename, new_name))
+
+        # Plan vérifié avant de toucher au disque : os.replace écrase sans prévenir
+        conflicts = self._find_conflicts(plan)
+        if conflicts:
+            for conflict in conflicts:
+                print(Fore.RED + f"Conflit : {conflict}")
+            print(Fore.RED + "Aucun fichier renommé.")
+            return
+
+        if self.dry_run:
+            for *_, filename, new_name in plan:
                 print(Fore.YELLOW + f"[DRY-RUN] {filename} → {new_name}")
-            else:
-                if self.confirm and not self._confirm(filename, new_name):
-                    print(Fore.RED + f"Renommage annulé pour : {filename}")
-                    continue
-                os.rename(original_path, new_path)
+            return
+
+        if self._apply_plan(plan):
+            for *_, filename, new_name in plan:
                 print(Fore.GREEN + f"Renommé : {filename} → {new_name}")
 
 
@@ -0,0 +1,32 @@
+import os
+
+from renamer import FileRenamer, RenameConfig
+
+
+def _rename(path, **options):
+    FileRenamer(RenameConfig(path=str(path), dry_run=False, **options)).rename()
+
+
+def _contents(path):
+    return {name: (path / name).read_text() for name in sorted(os.listdir(path))}
+
+
+def test_target_matching_another_temp_name_is_refused(tmp_path, capsys):
+    (tmp_path / "a").write_text("a")
+    (tmp_path / "b").write_text("b")
+
+    _rename(tmp_path, pattern="{name}_", replace="a_:b.__rn_tmp")
+
+    assert _contents(tmp_path) == {"a": "a", "b": "b"}
+    assert "Conflit" in capsys.readouterr().out
+
+
+def test_target_matching_another_temp_name_is_reported_in_dry_run(tmp_path, capsys):
+    (tmp_path / "a").write_text("a")
+    (tmp_path / "b").write_text("b")
+
+    FileRenamer(RenameConfig(path=str(tmp_path), pattern="{name}_",
+                             replace="a_:b.__rn_tmp")).rename()
+
+    assert "Conflit" in capsys.readouterr().out
+    assert _contents(tmp_path) == {"a": "a", "b": "b"}
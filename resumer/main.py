@@ -3,10 +3,16 @@ from typing import Optional
 from datetime import datetime, timedelta
 from imapclient import IMAPClient
 from InquirerPy import inquirer
+from InquirerPy.validator import NumberValidator
 import email
+import re
 from email.header import decode_header
 from dateutil.parser import parse as parse_date
 
+# BODY.PEEK ne télécharge que l'en-tête Subject et ne marque pas le mail comme lu
+SUBJECT_FETCH = 'BODY.PEEK[HEADER.FIELDS (SUBJECT)]'
+SUBJECT_KEY = b'BODY[HEADER.FIELDS (SUBJECT)]'
+
 
 @dataclass
 class MailCleanConfig:
@@ -23,6 +29,7 @@ class MailCleaner:
     def __init__(self, config: MailCleanConfig):
         self.config = config
         self.client = None
+        self._subjects = {}
 
     def connect(self):
         print(f"Connexion à {self.config.server}...")
@@ -34,29 +41,60 @@ class MailCleaner:
         self.client.select_folder('INBOX')
         date_cutoff = (datetime.now() -
                        timedelta(days=self.config.days_limit)).date()
-        criteria = ['BEFORE', date_cutoff.strftime('%d-%b-%Y')]
-        if self.config.use_spam_filter:
-            #on ignore les spams
-            pass
-        messages = self.client.search(criteria)
+        messages = self.client.search(self.get_search_criteria(date_cutoff))
         return messages
 
+    def get_search_criteria(self, date_cutoff):
+        """Critères SEARCH évalués côté serveur, spams exclus si demandé."""
+        criteria = ['BEFORE', date_cutoff.strftime('%d-%b-%Y')]
+        # Gmail ne range jamais les spams dans INBOX : rien à exclure
+        if self.config.use_spam_filter and self.get_provider() != "gmail":
+            criteria += ['NOT', 'KEYWORD', '$Junk']
+        return criteria
+
     def fetch_mail_subject(self, uid):
-        raw = self.client.fetch([uid], ['RFC822'])[uid][b'RFC822']
-        msg = email.message_from_bytes(raw)
-        subject, encoding = decode_header(msg.get('Subject'))[0]
-        if isinstance(subject, bytes):
+        return self._fetch_subjects([uid])[uid]
+
+    def _fetch_subjects(self, uids):
+        """Récupère les sujets en un seul FETCH et les garde en cache."""
+        missing = [uid for uid in uids if uid not in self._subjects]
+        if missing:
+            response = self.client.fetch(missing, [SUBJECT_FETCH])
+            for uid, data in response.items():
+                self._subjects[uid] = self._parse_subject(data[SUBJECT_KEY])
+        return {uid: self._subjects.get(uid, '') for uid in uids}
+
+    def _parse_subject(self, raw):
+        """Extrait le sujet de l'en-tête brut sans passer par le parseur MIME."""
+        name, sep, value = raw.partition(b':')
+        if sep and name.strip().lower() == b'subject':
+            # Dépliage des lignes de continuation (RFC 5322)
+            value = re.sub(rb'\r?\n(?=[ \t])', b'', value).strip()
             try:
-                subject = subject.decode(encoding or 'utf-8')
-            except:
-                subject = subject.decode('utf-8', errors='ignore')
-        return subject
+                return self._decode_subject(value.decode('ascii'))
+            except UnicodeDecodeError:
+                pass
+        msg = email.message_from_bytes(raw)
+        return self._decode_subject(msg.get('Subject'))
+
+    def _decode_subject(self, raw_subject):
+        if not raw_subject:
+            return ''
+        parts = []
+        for part, encoding in decode_header(raw_subject):
+            if isinstance(part, bytes):
+                try:
+                    part = part.decode(encoding or 'utf-8')
+                except (LookupError, UnicodeDecodeError):
+                    part = part.decode('utf-8', errors='ignore')
+            parts.append(part)
+        return ''.join(parts)
 
     def simulate(self, messages):
         print(f"[Simulation] {len(messages)} mails correspondent aux règles :")
+        subjects = self._fetch_subjects(messages[:10])
         for uid in messages[:10]:
-            subject = self.fetch_mail_subject(uid)
-            print(f"- UID {uid}: {subject}")
+            print(f"- UID {uid}: {subjects[uid]}")
         if len(messages) > 10:
             print(f"... et {len(messages)-10} autres mails.")
 
@@ -70,6 +108,8 @@ class MailCleaner:
 
     def delete_mails(self, messages):
         to_delete = []
+        if self.config.confirm:
+            self._fetch_subjects(messages)
         for uid in messages:
             if self.confirm_action(uid):
                 to_delete.append(uid)
@@ -82,20 +122,25 @@ class MailCleaner:
 
     def summarize(self, messages):
         print(f"Résumé des {len(messages)} mails ciblés (10 premiers) :")
+        subjects = self._fetch_subjects(messages[:10])
         for uid in messages[:10]:
-            subject = self.fetch_mail_subject(uid)
-            print(f"- {subject}")
+            print(f"- {subjects[uid]}")
 
-    def get_archive_folder(self):
+    def get_provider(self):
         server = self.config.server.lower()
         if "gmail" in server:
-            return "[Gmail]/All Mail"
+            return "gmail"
         elif "outlook" in server or "office365" in server:
-            return "Archive"
+            return "outlook"
         elif "yahoo" in server:
-            return "Archive"
+            return "yahoo"
         else:
-            return "Archive"
+            return "autre"
+
+    def get_archive_folder(self):
+        if self.get_provider() == "gmail":
+            return "[Gmail]/All Mail"
+        return "Archive"
 
     def archive_mails(self, messages):
         archive_folder = self.get_archive_folder()
@@ -117,6 +162,8 @@ class MailCleaner:
                 return
 
         to_move = []
+        if self.config.confirm:
+            self._fetch_subjects(messages)
         for uid in messages:
             if self.config.confirm:
                 subject = self.fetch_mail_subject(uid)
@@ -185,8 +232,9 @@ def main():
         message="Mode simulation (dry-run) ?", default=True).execute()
     confirm = inquirer.confirm(
         message="Confirmation ligne par ligne ?", default=False).execute()
-    days_limit = int(inquirer.text(
-        message="Nombre de jours limite (ex: 30):", default="30").execute())
+    days_limit = inquirer.text(
+        message="Nombre de jours limite (ex: 30):", default="30",
+        validate=NumberValidator(), filter=int).execute()
 
     config = MailCleanConfig(
         server=server,